@@ -29,13 +29,16 @@ parameters.
 The application uses the following modules:
 - tkinter: For creating the GUI.
 - numpy: For numerical operations.
+- numba: For compiling the regression kernel (optional).
+- pandas: For reading the signal files.
+- concurrent.futures: For reading the signal files in parallel.
 - matplotlib: For plotting the calibration results.
 
 Functions:
-- m(x, w): Calculate the weighted mean.
-- cov(x, y, w): Calculate the weighted covariance.
-- corr(x, y, w): Calculate the weighted correlation.
 - wls(x, y, w): Perform weighted least squares regression.
+- mean_std(signal_file, column): Calculate the mean and standard deviation of a signal column.
+- read_signal_stats(file_path, mtime, mass): Read the mean and standard deviation of a mass.
+- read_signal(file_path, mass): Get the mean and standard deviation of a mass, using the cache.
 
 Classes:
 - CalibrationApp: Main class for the calibration application.
@@ -55,73 +58,154 @@ __email__ = "dariobc@inventati.org"
 __status__ = "Prototype"
 
 
+import functools
+import os
+import re
 import tkinter as tk
+from concurrent.futures import ThreadPoolExecutor
+from itertools import repeat
 from tkinter import ttk, filedialog, messagebox
 
 import numpy as np
+import pandas as pd
 from matplotlib import pyplot as plt
 
+try:
+    from numba import njit
+except ImportError:  # numba is optional, the kernels then run as plain Python
 
-def m(x, w):
-    """
-    Calculate the weighted mean.
+    def njit(*args, **kwargs):
+        """Return the decorated function unchanged when numba is missing."""
+        return lambda f: f
 
-    Parameters:
-    x (array-like): Values.
-    w (array-like): Weights.
 
-    Returns:
-    float: Weighted mean of x.
-    """
-    return np.sum(x * w) / np.sum(w)
+CHUNKSIZE = 1000000
+MAX_WORKERS = 8
+NUMBER_PATTERN = re.compile(r"[-+]?\d*\.?\d*([eE][-+]?\d*)?")
 
 
-def cov(x, y, w):
+@njit(cache=True, error_model="numpy")
+def wls(x, y, w):
     """
-    Calculate the weighted covariance.
+    Perform weighted least squares regression.
+
+    The weighted means and the centered second order moments are accumulated
+    in two explicit loops, which numba compiles into a single kernel when it
+    is available. Divisions by zero give nan or inf, as in plain Python with
+    NumPy arrays, instead of raising ZeroDivisionError.
 
     Parameters:
-    x (array-like): Values of the first variable.
-    y (array-like): Values of the second variable.
-    w (array-like): Weights.
+    x (np.ndarray): Independent variable values.
+    y (np.ndarray): Dependent variable values.
+    w (np.ndarray): Weights.
 
     Returns:
-    float: Weighted covariance of x and y.
+    tuple: (slope, intercept, r_squared) of the regression line.
     """
-    return np.sum(w * (x - m(x, w)) * (y - m(y, w))) / np.sum(w)
+    sw = 0.0
+    sx = 0.0
+    sy = 0.0
+    for i in range(x.size):
+        sw += w[i]
+        sx += w[i] * x[i]
+        sy += w[i] * y[i]
+    mx = sx / sw
+    my = sy / sw
+    sxx = 0.0
+    syy = 0.0
+    sxy = 0.0
+    for i in range(x.size):
+        dx = x[i] - mx
+        dy = y[i] - my
+        wdx = w[i] * dx
+        sxx += wdx * dx
+        sxy += wdx * dy
+        syy += w[i] * dy * dy
+    slope = sxy / sxx
+    return slope, my - mx * slope, sxy * sxy / (sxx * syy)
+
+
+def mean_std(signal_file, column):
+    """
+    Calculate the mean and the standard deviation of a signal column.
 
+    The file is read in chunks of CHUNKSIZE rows and only the sum and the sum
+    of squares are accumulated, so the whole signal is never held in memory.
 
-def corr(x, y, w):
+    Parameters:
+    signal_file (file object): Signal file positioned at the first data row.
+    column (int): Index of the signal column in the file.
+
+    Returns:
+    tuple: (mean, standard_deviation) of the signal.
+    """
+    n = 0
+    s1 = 0.0
+    s2 = 0.0
+    for chunk in pd.read_csv(
+        signal_file,
+        sep="\t",
+        header=None,
+        usecols=[column],
+        dtype=np.float32,
+        engine="c",
+        chunksize=CHUNKSIZE,
+    ):
+        signal = chunk.to_numpy(dtype=np.float64)[:, 0]
+        n += signal.size
+        s1 += signal.sum()
+        s2 += np.dot(signal, signal)
+    mean = s1 / n
+    return mean, np.sqrt(max(s2 / n - mean * mean, 0.0))
+
+
+@functools.lru_cache(maxsize=128)
+def read_signal_stats(file_path, mtime, mass):
     """
-    Calculate the weighted correlation.
+    Read the mean and the standard deviation of a mass from a signal file.
+
+    The header and the signal are read through the same open file. The result
+    is cached, the modification time is part of the key so that a modified
+    file is read again.
 
     Parameters:
-    x (array-like): Values of the first variable.
-    y (array-like): Values of the second variable.
-    w (array-like): Weights.
+    file_path (str): Path of the signal file.
+    mtime (float): Modification time of the signal file.
+    mass (int): Mass whose signal is read.
 
     Returns:
-    float: Weighted correlation of x and y.
+    tuple: (mean, standard_deviation) of the signal.
+
+    Raises:
+    ValueError: If the mass is not available in the file.
     """
-    return cov(x, y, w) / np.sqrt(cov(x, x, w) * cov(y, y, w))
+    with open(file_path, "r", encoding="utf-8") as f:
+        first_line = f.readline()
+        new_masses = [int(x) for x in first_line.split()[2:]]
+        if mass not in new_masses:
+            raise ValueError(
+                f"Mass {mass} not in available masses {new_masses} in file {file_path}."
+            )
+        return mean_std(f, new_masses.index(mass) + 1)
 
 
-def wls(x, y, w):
+def read_signal(file_path, mass):
     """
-    Perform weighted least squares regression.
+    Get the mean and the standard deviation of a mass from a signal file.
+
+    The cached result is reused as long as the file is not modified.
 
     Parameters:
-    x (array-like): Independent variable values.
-    y (array-like): Dependent variable values.
-    w (array-like): Weights.
+    file_path (str): Path of the signal file.
+    mass (int): Mass whose signal is read.
 
     Returns:
-    tuple: (slope, intercept, r_squared) of the regression line.
+    tuple: (mean, standard_deviation) of the signal.
+
+    Raises:
+    ValueError: If the mass is not available in the file.
     """
-    c = corr(x, y, w)
-    slope = c * np.std(y) / np.std(x)
-    intercept = m(y, w) - m(x, w) * slope
-    return slope, intercept, c**2
+    return read_signal_stats(file_path, os.path.getmtime(file_path), mass)
 
 
 class CalibrationApp:
@@ -240,9 +324,6 @@ class CalibrationApp:
 
     def calibrate(self):
         """Perform calibration using the selected files and entered concentrations."""
-        x = []
-        y = []
-        s = []
         if not (self.mass_entry.get()):
             messagebox.showerror("Error", "No mass selected for the calibration.")
             return
@@ -252,40 +333,44 @@ class CalibrationApp:
                 "Error", "At least three points are needed for the calibration."
             )
             return
-        for _, file_label, concentration_entry in self.rows:
-            try:
-                file_path = file_label.get()
-                with open(file_path, "r", encoding="utf-8") as f:
-                    first_line = f.readline()
-                    new_masses = [int(x) for x in first_line.split()[2:]]
-                    if mass not in new_masses:
-                        messagebox.showerror(
-                            "Error",
-                            f"Mass {mass} not in available masses {new_masses} in file {file_path}.",
-                        )
-                        return
-                    else:
-                        signal = np.loadtxt(
-                            file_path,
-                            delimiter="\t",
-                            skiprows=1,
-                            usecols=[new_masses.index(mass) + 1],
-                        )
-            except OSError as e:
-                messagebox.showerror(
-                    "Error", f"An error occurred while reading the file:\n{e}"
-                )
-                return
-            x.append(float(concentration_entry.get()))
-            y.append(np.mean(signal))
-            s.append(np.std(signal))
+        file_paths = [file_label.get() for _, file_label, _ in self.rows]
+        try:
+            x = [float(entry.get()) for _, _, entry in self.rows]
+        except ValueError:
+            messagebox.showerror("Error", "Invalid concentration value.")
+            return
+        # Every file is read in its own thread, the pandas C parser releases the GIL
+        try:
+            with ThreadPoolExecutor(min(MAX_WORKERS, len(file_paths))) as executor:
+                results = list(executor.map(read_signal, file_paths, repeat(mass)))
+        except OSError as e:
+            messagebox.showerror(
+                "Error", f"An error occurred while reading the file:\n{e}"
+            )
+            return
+        except ValueError as e:
+            messagebox.showerror("Error", str(e))
+            return
+        y, s = zip(*results)
 
         x = np.array(x)
         y = np.array(y)
         s = np.array(s)
         w = 1 / s**2
 
+        if np.ptp(x) == 0:
+            messagebox.showerror(
+                "Error", "At least two different concentrations are needed."
+            )
+            return
+        if np.ptp(y) == 0:
+            messagebox.showerror("Error", "All the intensities are equal.")
+            return
+
         slope, intercept, r2 = wls(x, y, w)
+        if not np.isfinite([slope, intercept, r2]).all():
+            messagebox.showerror("Error", "The regression could not be computed.")
+            return
         xp = [x.min(), x.max()]
         pred = np.array([intercept + x.min() * slope, intercept + x.max() * slope])
 
@@ -316,7 +401,10 @@ class CalibrationApp:
 
     def validate_calibration_number(self, mass):
         """
-        Validate if the input string can be converted to a float.
+        Validate if the input string is a float, complete or being typed.
+
+        Partial inputs such as "", "-", "1." or "1e" are accepted so that any
+        number can be typed character by character.
 
         Parameters:
         mass (str): Input string to validate.
@@ -324,12 +412,10 @@ class CalibrationApp:
         Returns:
         bool: True if valid float, False otherwise.
         """
-        try:
-            float(mass)
+        if NUMBER_PATTERN.fullmatch(mass):
             return True
-        except ValueError:
-            self.frame.bell()
-            return False
+        self.frame.bell()
+        return False
 
 
 if __name__ == "__main__":
@@ -30,12 +30,14 @@ Modules:
     - filedialog: Provides file selection dialogs.
     - messagebox: Provides message box dialogs.
     - threading: Allows running tasks in separate threads.
-    - mmap: Provides memory-mapped file support.
-    - pandas: Provides data manipulation and analysis tools.
+    - os: Provides file size and modification time queries.
+    - functools: Provides caching of the parsed file headers.
+    - operator: Provides fast selection of the columns of each line.
     - math: Provides mathematical functions.
 
 Functions:
-    - line_count(infile): Count the number of lines in a file.
+    - read_header(infile, mtime): Read the masses available in a file from its header.
+    - parse_header(infile): Get the masses available in a file, reusing the cached header.
     - data_selector(masses, infile, outfile): Select specific columns from a file and save to a new file.
     - save_selection(): Save the selected numbers to the output file(s).
     - long_running_function(selected_numbers, paths, save_path): Execute the data selection process for each file in a separate thread.
@@ -57,38 +59,57 @@ __email__ = "dariobc@inventati.org"
 __status__ = "Prototype"
 
 
-import mmap
+import functools
+import operator
+import os
 import threading
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox
 
-import pandas as pd
-
 
 CHUNKSIZE = 1000000
+BLOCKSIZE = 1 << 20
 
 
-def line_count(infile):
+@functools.lru_cache(maxsize=128)
+def read_header(infile, mtime):
     """
-    Count the number of lines in a file.
+    Read the masses available in a file from its header.
+
+    The result is cached, the modification time is part of the key so that a
+    modified file is read again.
 
     Parameters:
     infile (str): The path to the input file.
+    mtime (float): The modification time of the input file.
 
     Returns:
-    int: The number of lines in the file.
+    tuple of int: The masses available in the file, in column order.
+    """
+    with open(infile) as infile_r:
+        first_line = infile_r.readline()
+    return tuple(int(x) for x in first_line.split()[2:])
+
+def parse_header(infile):
     """
-    lines = 0
-    with open(infile, "r+") as f:
-        buf = mmap.mmap(f.fileno(), 0)
-        while buf.readline():
-            lines += 1
-    return lines
+    Get the masses available in a file, reusing the cached header if unchanged.
+
+    Parameters:
+    infile (str): The path to the input file.
+
+    Returns:
+    tuple of int: The masses available in the file, in column order.
+    """
+    return read_header(infile, os.path.getmtime(infile))
 
 def data_selector(masses, infile, outfile):
     """
     Select specific columns from a file based on given masses and save to a new file.
 
+    The selected fields are cut from each line as raw bytes, so the values are
+    copied verbatim instead of being parsed and formatted again. Each line is
+    only split up to the last selected column.
+
     Parameters:
     masses (list of int): The masses to select.
     infile (str): The path to the input file.
@@ -97,17 +118,32 @@ def data_selector(masses, infile, outfile):
     Yields:
     float: The progress percentage of the operation.
     """
-    with open(infile) as infile_r:
-        first_line = infile_r.readline().strip()
-        available_masses = [int(x) for x in first_line.split()[2:]]
-    columns = [0] + [available_masses.index(int(i)) for i in masses]
-    lines = line_count(infile)
-
-    with open(outfile, "w") as outfile:
-        outfile.write("Push number\t" + "\t".join(str(m) for m in masses) + "\n")
-        for chunk in pd.read_csv(infile, delimiter="\t", chunksize=CHUNKSIZE):
-            chunk.iloc[:, columns].to_csv(outfile, index=False, header=False, sep="\t")
-            yield 100 - (1 - chunk.index[-1] / lines) * 100
+    available_masses = parse_header(infile)
+    columns = [0] + [available_masses.index(int(i)) + 1 for i in masses]
+    # Fields after the last selected column are never split
+    maxsplit = max(columns) + 1
+    select = operator.itemgetter(*columns)
+    # Rows cut short are padded with empty fields, as pandas fills them with NaN
+    padding = [b""] * maxsplit
+    filesize = os.path.getsize(infile)
+
+    with open(infile, "rb", buffering=BLOCKSIZE) as infile_r, open(
+        outfile, "wb", buffering=BLOCKSIZE
+    ) as outfile_w:
+        infile_r.readline()
+        outfile_w.write(
+            ("Push number\t" + "\t".join(str(m) for m in masses) + "\n").encode()
+        )
+        for n, line in enumerate(infile_r, 1):
+            line = line.rstrip(b"\r\n")
+            if line:
+                fields = line.split(b"\t", maxsplit)
+                if len(fields) < maxsplit:
+                    fields += padding[len(fields) :]
+                outfile_w.write(b"\t".join(select(fields)) + b"\n")
+            if n % CHUNKSIZE == 0:
+                yield 100 * infile_r.tell() / filesize
+    yield 100.0
 
 def save_selection():
     """
@@ -157,22 +193,29 @@ def long_running_function(selected_numbers, paths, save_path):
     save_path (list of str): The output file paths.
     """
     paths = paths.split("\n")
-    for n, path in enumerate(paths):
-        if not thread_running:
-            break
-        progress_var.set(f"File: {n+1}/{len(paths)}\tGetting file size...")
-        for progress in data_selector(selected_numbers, path, save_path[n]):
+    try:
+        for n, path in enumerate(paths):
             if not thread_running:
                 break
-            progress_var.set(f"File: {n+1}/{len(paths)}\tProgress: {progress:.2f} %")
-    if thread_running:
-        progress_var.set("Modified files saved.")
+            progress_var.set(f"File: {n+1}/{len(paths)}\tGetting file size...")
+            for progress in data_selector(selected_numbers, path, save_path[n]):
+                if not thread_running:
+                    break
+                progress_var.set(
+                    f"File: {n+1}/{len(paths)}\tProgress: {progress:.2f} %"
+                )
+    except Exception as e:
+        progress_var.set("Operation failed.")
+        messagebox.showerror("Error", f"An error occurred while saving the files:\n{e}")
     else:
-        progress_var.set("Operation canceled by user.")
-
-    save_button.config(state=tk.NORMAL)
-    clear_button.config(state=tk.NORMAL)
-    cancel_button.config(state=tk.DISABLED)
+        if thread_running:
+            progress_var.set("Modified files saved.")
+        else:
+            progress_var.set("Operation canceled by user.")
+    finally:
+        save_button.config(state=tk.NORMAL)
+        clear_button.config(state=tk.NORMAL)
+        cancel_button.config(state=tk.DISABLED)
 
 def clear_selection():
     """
@@ -198,10 +241,8 @@ def select_file():
         file_path_label.config(text="")
         for file_path in file_paths:
             try:
-                with open(file_path, "r") as f:
-                    first_line = f.readline()
-                    new_masses = [int(x) for x in first_line.split()[2:]]
-                    available_masses = [i for i in available_masses if i in new_masses]
+                new_masses = set(parse_header(file_path))
+                available_masses = [i for i in available_masses if i in new_masses]
             except Exception as e:
                 messagebox.showerror(
                     "Error", f"An error occurred while reading the file:\n{e}"
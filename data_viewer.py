@@ -39,24 +39,207 @@ __maintainer__ = "Dario Bagues Castro"
 __email__ = "dariobc@inventati.org"
 __status__ = "Prototype"
 
+import mmap
+import os
 import tkinter as tk
+from concurrent.futures import ThreadPoolExecutor
 from tkinter import ttk, filedialog, messagebox
 
 import numpy as np
 import matplotlib.pyplot as plt
 import matplotlib.style as mplstyle
+from matplotlib.lines import Line2D
+
+try:
+    import pyarrow as pa
+    import pyarrow.csv as pacsv
+except ImportError:  # pyarrow is optional, pandas is used instead
+    pa = None
+
+try:
+    import pandas as pd
+except ImportError:  # pandas is optional, np.loadtxt is used instead
+    pd = None
+
+
+SMALL_FILE_SIZE = 512 * 1024
+DECIMATION_TARGET = 4000
+RASTERIZE_ROWS = 100000
+# Grid position and selection bit of every mass number, in the order 75 to 209
+MASS_POSITIONS = tuple(divmod(n - 75, 10) for n in range(75, 210))
+MASS_BITS = tuple((n, 1 << (n - 75)) for n in range(75, 210))
+
+
+def load_data(path):
+    """
+    Load every column of a data file, reusing the cached array if unchanged.
+
+    The parsed array is kept in data_cache together with the path and the
+    modification time of the file, so viewing another selection of masses of
+    the same file only slices columns in memory. Values are stored as float32,
+    which is enough precision for plotting and halves the memory used. Large
+    files are parsed with tsv_parser.parse_tsv when numba is available, else
+    with pyarrow or pandas. The array is column-major so every column is
+    contiguous in memory.
+
+    Args:
+        path (str): Path of the data file.
+
+    Returns:
+        numpy.ndarray: Column-major array with one column per column of the file.
+    """
+    import tsv_parser  # Imported on first use, see select_file
+
+    stat = os.stat(path)
+    key = (path, stat.st_mtime_ns)
+    if data_cache["key"] != key:
+        if stat.st_size < SMALL_FILE_SIZE:
+            # The setup cost of the parsers below dominates for small files
+            with open(path, encoding="utf-8") as f:
+                ncols = f.readline().count("\t") + 1
+                lines = f.read().splitlines()
+            # As in pandas, blank lines are skipped and empty or missing fields are NaN
+            rows = []
+            for n, line in enumerate(lines, 2):
+                if not line.strip():
+                    continue
+                fields = [field.strip() or "nan" for field in line.split("\t")]
+                if len(fields) > ncols:
+                    raise ValueError(
+                        f"Expected {ncols} fields in line {n}, saw {len(fields)}."
+                    )
+                rows.append(fields + ["nan"] * (ncols - len(fields)))
+            # reshape keeps a file without rows 2-D
+            array = np.array(rows, dtype=np.float32).reshape(-1, ncols)
+            array = np.asfortranarray(array)
+        elif tsv_parser.HAVE_NUMBA:
+            # The kernels read the mapped file directly, without copying it
+            with open(path, "rb") as f, mmap.mmap(
+                f.fileno(), 0, access=mmap.ACCESS_READ
+            ) as mm:
+                body_start = mm.find(b"\n") + 1
+                ncols = mm[:body_start].count(b"\t") + 1
+                body = np.frombuffer(mm, dtype=np.uint8, offset=body_start)
+                try:
+                    array = np.full(
+                        (tsv_parser.count_rows(body), ncols),
+                        np.nan,
+                        dtype=np.float32,
+                        order="F",
+                    )
+                    tsv_parser.parse_tsv(
+                        body, np.arange(ncols, dtype=np.int32), ncols, array
+                    )
+                finally:
+                    # The map cannot be closed while the array still exports it
+                    del body
+        elif pa is not None:
+            # pyarrow tokenizes and converts the file on several threads
+            with open(path, encoding="utf-8") as f:
+                ncols = f.readline().count("\t") + 1
+            names = [str(i) for i in range(ncols)]
+            table = pacsv.read_csv(
+                path,
+                read_options=pacsv.ReadOptions(
+                    use_threads=True, skip_rows=1, column_names=names
+                ),
+                parse_options=pacsv.ParseOptions(delimiter="\t"),
+                convert_options=pacsv.ConvertOptions(
+                    column_types=dict.fromkeys(names, pa.float32())
+                ),
+            )
+            array = np.empty((table.num_rows, ncols), dtype=np.float32, order="F")
+            for i, column in enumerate(table.columns):
+                array[:, i] = column.to_numpy()
+        elif pd is not None:
+            array = pd.read_csv(
+                path,
+                sep="\t",
+                skiprows=1,
+                header=None,
+                dtype=np.float32,
+                engine="c",
+                memory_map=True,
+            ).to_numpy()
+            array = np.asfortranarray(array)
+        else:
+            array = np.loadtxt(
+                path, delimiter="\t", skiprows=1, ndmin=2, dtype=np.float32
+            )
+            array = np.asfortranarray(array)
+        data_cache["key"] = key
+        data_cache["array"] = array
+    return data_cache["array"]
+
+
+def decimate(x, y, target=DECIMATION_TARGET):
+    """
+    Reduce a long series to the minimum and maximum of each bucket.
+
+    The samples are split into target buckets and every bucket is replaced by
+    its minimum and maximum samples, in the order they occur and at their own
+    x coordinates, so the envelope of the signal, and every peak and edge, is
+    kept in place while Matplotlib only has to draw 2 * target points. The
+    samples left over after the last full bucket are kept unchanged.
+
+    Args:
+        x (numpy.ndarray): X coordinates of the samples.
+        y (numpy.ndarray): Contiguous values of the series.
+        target (int): Number of buckets.
+
+    Returns:
+        tuple: (x, y) of the decimated series, unchanged if already short.
+    """
+    n = y.size
+    if n <= 2 * target:
+        return x, y
+    size = n // target
+    m = size * target
+    buckets = y[:m].reshape(target, size)
+    low = buckets.argmin(axis=1)
+    high = buckets.argmax(axis=1)
+    starts = np.arange(0, m, size)
+    indexes = np.empty(2 * target + n - m, dtype=np.intp)
+    indexes[0 : 2 * target : 2] = starts + np.minimum(low, high)
+    indexes[1 : 2 * target : 2] = starts + np.maximum(low, high)
+    indexes[2 * target :] = np.arange(m, n)
+    return x[indexes], y[indexes]
+
+
+def redecimate(ax, x, columns, lines):
+    """
+    Decimate the series again over the visible x range of the axes.
+
+    Once zoomed in to fewer than 2 * DECIMATION_TARGET samples every sample is
+    drawn, so short events can be inspected.
+
+    Args:
+        ax (matplotlib.axes.Axes): Axes whose x limits changed.
+        x (numpy.ndarray): X coordinates of all the samples.
+        columns (list): Values of all the samples of every series.
+        lines (list): Line of every series.
+    """
+    xmin, xmax = ax.get_xlim()
+    # x holds the sample numbers 1 to n, so the limits map directly to indexes
+    start = min(max(int(np.floor(xmin)) - 1, 0), x.size)
+    stop = max(min(int(np.ceil(xmax)), x.size), start)
+    for line, y in zip(lines, columns):
+        line.set_data(*decimate(x[start:stop], y[start:stop]))
+    ax.figure.canvas.draw_idle()
 
 
 def generate_plot():
     """
     Generate a plot of the selected mass data from the file.
 
-    This function reads the file specified in the path_var variable, extracts
-    the data corresponding to the selected mass numbers, and plots it using
-    matplotlib. If no file is selected or no mass numbers are selected, it shows
-    an error message.
+    This function checks the selected file and mass numbers, disables the View
+    button and reads the data on the executor thread, so the GUI keeps
+    responding while a large file is parsed. The plot is then drawn by
+    finish_plot on the main thread. If no file is selected or no mass numbers
+    are selected, it shows an error message.
     """
-    selected_numbers = [number for number, var in number_vars.items() if var.get()]
+    # The selection is read from the bitmask, without querying every Tk variable
+    selected_numbers = [n for n, bit in MASS_BITS if selection_mask & bit]
     if path_var.get() == "":
         messagebox.showerror("Error", "No file selected.")
         return
@@ -65,34 +248,103 @@ def generate_plot():
         messagebox.showerror("Error", "No numbers selected.")
         return
 
-    with open(path_var.get(), encoding="utf-8") as f:
-        available = [int(m) for m in f.readline()[:-1].split("\t")[1:]]
-        masses = dict(zip(available, list(range(1, len(available) + 1))))
+    # The header was already parsed when the file was selected
+    if not masses_cache:
+        messagebox.showerror("Error", "No masses available in the selected file.")
+        return
+    columns = [(m, masses_cache[m]) for m in selected_numbers]
+
+    save_button.config(state="disabled")
+    future = executor.submit(load_plot_data, path_var.get(), columns)
+    # Tkinter and pyplot are only used from the main thread
+    future.add_done_callback(lambda f: root.after(0, finish_plot, f))
+
+
+def load_plot_data(path, columns):
+    """
+    Load a data file and decimate the series of the selected masses.
+
+    This function runs on the executor thread, the parsers release the GIL
+    while they read the file.
+
+    Args:
+        path (str): Path of the data file.
+        columns (list): (mass, column index) of every selected mass.
+
+    Returns:
+        tuple: (x, series, rasterized), with the x coordinates of all the
+        samples, the (mass, values, decimated x, decimated y) of every series
+        and whether the lines are drawn as bitmaps.
+    """
+    ar = load_data(path)
+    # Every column of the column-major array is a contiguous view, no copy is made,
+    # and the sample numbers fit in int32, half the size of the default int64
+    x = np.arange(1, ar.shape[0] + 1, dtype=np.int32)
+    # Long series are drawn as bitmaps when the figure is saved to a vector format
+    rasterized = ar.shape[0] > RASTERIZE_ROWS
+    series = [(m, ar[:, index], *decimate(x, ar[:, index])) for m, index in columns]
+    return x, series, rasterized
+
 
+def finish_plot(future):
+    """
+    Draw the series loaded by load_plot_data and enable the View button again.
+
+    Args:
+        future (concurrent.futures.Future): Future of load_plot_data.
+    """
+    save_button.config(state="normal")
     try:
-        ar = np.loadtxt(
-            path_var.get(),
-            delimiter="\t",
-            skiprows=1,
-            usecols=[masses[m] for m in selected_numbers],
-        )
+        x, series, rasterized = future.result()
     except OSError as e:
         messagebox.showerror("Error", f"An error occurred while reading the file:\n{e}")
         return
+    except ValueError as e:
+        # Parse errors of every reader, including pyarrow and pandas, are ValueError
+        messagebox.showerror("Error", f"The file could not be parsed:\n{e}")
+        return
 
-    plt.plot(range(1, ar.shape[0] + 1), ar, label=selected_numbers)
-    plt.legend(loc=1)
+    lines = [
+        Line2D(line_x, line_y, color=f"C{j}", label=str(m), rasterized=rasterized)
+        for j, (m, _, line_x, line_y) in enumerate(series)
+    ]
+
+    # Add the lines directly to the axes and autoscale once for all of them
+    _, ax = plt.subplots()
+    for line in lines:
+        ax.add_line(line)
+    ax.autoscale_view()
+    ax.legend(handles=lines, loc=1)
+    # Zooming in draws the samples of the visible range instead of the envelope
+    columns = [y for _, y, _, _ in series]
+    ax.callbacks.connect("xlim_changed", lambda ax: redecimate(ax, x, columns, lines))
 
     # Show the plot in a regular pyplot window
     plt.show()
 
 
+def toggle_mass(n):
+    """
+    Update the selection bitmask when a mass number checkbutton is toggled.
+
+    Bit n - 75 of selection_mask is set while mass n is checked, so the
+    selection can be read without a Tk round-trip per checkbutton.
+
+    Args:
+        n (int): Toggled mass number.
+    """
+    global selection_mask
+    selection_mask ^= 1 << (n - 75)
+
+
 def clear_selection():
     """
     Clear all mass number selections.
 
     This function resets all mass number checkbuttons to an unchecked state.
     """
+    global selection_mask
+    selection_mask = 0
     for n in number_vars.values():
         n.set(False)
 
@@ -102,7 +354,8 @@ def select_file():
     Open a file dialog to select a file and enable relevant checkbuttons.
 
     This function opens a file dialog for the user to select a file. It then reads
-    the available mass numbers from the file and enables the corresponding checkbuttons.
+    the available mass numbers from the file, keeps their column indexes in
+    masses_cache and enables the corresponding checkbuttons.
     If an error occurs while reading the file, it shows an error message and disables
     all checkbuttons.
     """
@@ -110,12 +363,32 @@ def select_file():
     if file_path:
         available_masses = range(75, 210)
         file_path_label.config(text="")
+        masses_cache.clear()
+        # Importing the parsers loads their compiled kernels, which is left out
+        # of the start of the GUI and done on the first file selection instead
+        import tsv_parser
+
         try:
-            with open(file_path, "r", encoding="utf-8") as f:
-                first_line = f.readline()
-                new_masses = [int(x) for x in first_line.split()[2:]]
-                available_masses = [i for i in available_masses if i in new_masses]
-        except OSError as e:
+            with open(file_path, "rb") as f:
+                header = f.readline()
+            if tsv_parser.HAVE_NUMBA:
+                new_masses = tsv_parser.parse_header(
+                    np.frombuffer(header, dtype=np.uint8)
+                )
+            else:
+                # One conversion in NumPy beats running the kernel as plain Python
+                new_masses = np.array(header.split(b"\t")[1:], dtype=np.int32)
+            # A column that is not a mass would shift the index of every later one
+            invalid = np.flatnonzero(new_masses < 0)
+            if invalid.size:
+                field = header.split(b"\t")[invalid[0] + 1].strip()
+                field = field.decode(errors="replace")
+                raise ValueError(f"Invalid mass number in the header: {field}")
+            new_masses = new_masses.tolist()
+            new_masses_set = set(new_masses)
+            available_masses = [i for i in available_masses if i in new_masses_set]
+            masses_cache.update({m: i + 1 for i, m in enumerate(new_masses)})
+        except (OSError, ValueError) as e:
             messagebox.showerror(
                 "Error", f"An error occurred while reading the file:\n{e}"
             )
@@ -137,15 +410,14 @@ def enable_buttons(available_masses):
     in the selected file and disables the others.
 
     Args:
-        available_masses (list): List of available mass numbers.
+        available_masses (iterable): Available mass numbers.
     """
-    for n in range(75, 210):
-        if n in available_masses:
-            number_vars[n].set(False)  # Uncheck by default
-            number_buttons[n].state(["!disabled"])
-        else:
-            number_vars[n].set(False)
-            number_buttons[n].state(["disabled"])
+    global selection_mask
+    selection_mask = 0
+    available_masses = set(available_masses)
+    for n, var, button in button_items:
+        var.set(False)  # Uncheck by default
+        button.state(["!disabled"] if n in available_masses else ["disabled"])
 
 
 def disable_buttons():
@@ -154,9 +426,11 @@ def disable_buttons():
 
     This function disables all mass number checkbuttons and sets their state to unchecked.
     """
-    for n in range(75, 210):
-        number_vars[n].set(False)
-        number_buttons[n].state(["disabled"])
+    global selection_mask
+    selection_mask = 0
+    for _, var, button in button_items:
+        var.set(False)
+        button.state(["disabled"])
 
 
 def on_closing():
@@ -166,12 +440,23 @@ def on_closing():
     This function quits the Tkinter main loop and destroys the root window when the
     user attempts to close the application window.
     """
+    # A file still being read is not plotted once the window is gone
+    executor.shutdown(wait=False, cancel_futures=True)
     root.quit()
     root.destroy()
 
 
+# The fast style sets path.simplify, path.simplify_threshold = 1.0 and
+# agg.path.chunksize = 10000, so long lines skip sub-pixel segments
 mplstyle.use("fast")
 
+# Column index of every mass in the selected file, filled in by select_file
+masses_cache = {}
+# Last loaded data file, filled in by load_data
+data_cache = {"key": None, "array": None}
+# Single thread that reads data files for generate_plot
+executor = ThreadPoolExecutor(max_workers=1)
+
 # Create main window
 root = tk.Tk()
 root.title("Data Selector")
@@ -198,18 +483,30 @@ file_button = ttk.Button(file_frame, text="Select Files", command=select_file)
 file_button.grid(row=0, column=0, padx=5)
 
 # Create mass selection checkbuttons for numbers 75 to 209
+# The frame is only packed once all of them are gridded, so the geometry
+# managers lay it out a single time instead of after every checkbutton
 frame = tk.Frame(root)
-frame.pack(padx=10, pady=10)
 
 # Create checkable buttons
+selection_mask = 0
 number_vars = {}
 number_buttons = {}
-for num in range(75, 210):
+labels = tuple(str(num) for num in range(75, 210))
+for i, num in enumerate(range(75, 210)):
     var = tk.BooleanVar()
-    chk = ttk.Checkbutton(frame, text=str(num), variable=var, state="disabled")
-    chk.grid(row=(num - 75) // 10, column=(num - 75) % 10, padx=5, pady=5, sticky="w")
+    chk = ttk.Checkbutton(
+        frame,
+        text=labels[i],
+        variable=var,
+        state="disabled",
+        command=lambda n=num: toggle_mass(n),
+    )
+    row, column = MASS_POSITIONS[i]
+    chk.grid(row=row, column=column, padx=5, pady=5, sticky="w")
     number_vars[num] = var
     number_buttons[num] = chk
+button_items = [(n, number_vars[n], number_buttons[n]) for n in number_buttons]
+frame.pack(padx=10, pady=10)
 
 # Create view and clear buttons
 button_frame = tk.Frame(root)
@@ -0,0 +1,217 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2024 Dario Bagues Castro
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by the
+# Free Software Foundation, either version 3 of the License, or (at your
+# option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU General
+# Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/>.
+#
+
+"""
+This module provides the numba kernels used by data_viewer to parse data files.
+
+The kernels are compiled ahead of time for explicit signatures and cached on
+disk. The module is imported by data_viewer on the first file selection, so
+compiling or loading the kernels does not slow down the start of the GUI.
+
+Author: Dario Bagues Castro
+"""
+
+__author__ = "Dario Bagues Castro"
+__copyright__ = "Copyright (C) 2024, Dario Bagues Castro"
+__license__ = "GPLv3-or-later"
+__version__ = "0.0.1"
+__maintainer__ = "Dario Bagues Castro"
+__email__ = "dariobc@inventati.org"
+__status__ = "Prototype"
+
+import numpy as np
+
+try:
+    from numba import njit, types
+
+    HAVE_NUMBA = True
+    # Arrays from np.frombuffer over bytes or a read-only map are read-only
+    BYTES = types.Array(types.uint8, 1, "C", readonly=True)
+    PARSE_HEADER_SIGNATURE = types.int32[:](BYTES)
+    COUNT_ROWS_SIGNATURE = types.int64(BYTES)
+    PARSE_TSV_SIGNATURE = types.void(
+        BYTES, types.int32[:], types.int32, types.float32[:, :]
+    )
+except ImportError:  # numba is optional, the parsers then run as plain Python
+    HAVE_NUMBA = False
+    PARSE_HEADER_SIGNATURE = COUNT_ROWS_SIGNATURE = PARSE_TSV_SIGNATURE = None
+
+    def njit(*args, **kwargs):
+        """Return the decorated function unchanged when numba is missing."""
+        return lambda f: f
+
+
+@njit(PARSE_HEADER_SIGNATURE, cache=True)
+def parse_header(buf):
+    """
+    Parse the mass numbers from the header line of a data file.
+
+    The bytes are scanned once, skipping the label of the first column and
+    accumulating the digits of every following tab separated field. A field
+    that is not a whole number, apart from surrounding spaces, is returned as
+    -1 so that the caller can reject the header.
+
+    Args:
+        buf (numpy.ndarray): Bytes of the header line, as uint8.
+
+    Returns:
+        numpy.ndarray: Mass numbers in column order, as int32.
+    """
+    out = np.empty(buf.size, dtype=np.int32)
+    count = 0
+    start = 0
+    while start < buf.size and buf[start] != 9:
+        start += 1
+    if start == buf.size:
+        return out[:0]
+    value = 0
+    state = 0  # 0 before, 1 within and 2 after the digits of the field
+    valid = True
+    for i in range(start + 1, buf.size + 1):
+        c = buf[i] if i < buf.size else 10
+        if c == 9 or c == 10 or c == 13:
+            out[count] = value if valid and state > 0 else -1
+            count += 1
+            if c != 9:
+                break
+            value = 0
+            state = 0
+            valid = True
+        elif 48 <= c <= 57:
+            valid = valid and state < 2
+            value = value * 10 + int(c) - 48
+            state = 1
+        elif c == 32:
+            if state == 1:
+                state = 2
+        else:
+            valid = False
+    return out[:count]
+
+
+@njit(COUNT_ROWS_SIGNATURE, cache=True)
+def count_rows(buf):
+    """
+    Count the rows of the body of a tab separated file.
+
+    Blank lines, empty apart from a carriage return, are not rows, as in pandas.
+
+    Args:
+        buf (numpy.ndarray): Bytes of the body of the file, as uint8.
+
+    Returns:
+        int: Number of non-blank lines, including a last line without a newline.
+    """
+    rows = 0
+    content = False
+    for i in range(buf.size):
+        c = buf[i]
+        if c == 10:
+            if content:
+                rows += 1
+            content = False
+        elif c != 13:
+            content = True
+    if content:
+        rows += 1
+    return rows
+
+
+@njit(PARSE_TSV_SIGNATURE, cache=True, boundscheck=False, fastmath=True)
+def parse_tsv(buf, col_indices, ncols, out):
+    """
+    Parse selected columns of the body of a tab separated file.
+
+    The bytes are walked once, keeping track of the current row and column,
+    and only the fields of the requested columns are converted to float.
+    Blank lines are skipped, as in count_rows.
+    Fields that are not a decimal number, such as nan, inf or 1,5, are left
+    untouched, so out must be filled with NaN beforehand.
+
+    Args:
+        buf (numpy.ndarray): Bytes of the body of the file, as uint8.
+        col_indices (numpy.ndarray): File column of every output column.
+        ncols (int): Number of columns of the file.
+        out (numpy.ndarray): Output array of shape (rows, len(col_indices)).
+    """
+    targets = np.full(ncols, -1, dtype=np.int32)
+    for k in range(col_indices.size):
+        targets[col_indices[k]] = k
+    n = buf.size
+    row = 0
+    col = 0
+    content = False
+    i = 0
+    while i < n and row < out.shape[0]:
+        c = buf[i]
+        if c != 10 and c != 13:
+            content = True
+        if c == 9:  # tab
+            col += 1
+            i += 1
+        elif c == 10:  # newline
+            if content:
+                row += 1
+            col = 0
+            content = False
+            i += 1
+        elif col >= ncols or targets[col] < 0 or c == 13 or c == 32:
+            i += 1
+        else:
+            negative = c == 45  # minus sign
+            if c == 45 or c == 43:
+                i += 1
+            value = 0.0
+            digits = False
+            while i < n and 48 <= buf[i] <= 57:
+                value = value * 10.0 + (buf[i] - 48)
+                digits = True
+                i += 1
+            if i < n and buf[i] == 46:  # decimal point
+                i += 1
+                scale = 0.1
+                while i < n and 48 <= buf[i] <= 57:
+                    value += (buf[i] - 48) * scale
+                    scale *= 0.1
+                    digits = True
+                    i += 1
+            valid = digits
+            if valid and i < n and (buf[i] == 101 or buf[i] == 69):  # exponent
+                i += 1
+                negative_exponent = i < n and buf[i] == 45
+                if i < n and (buf[i] == 45 or buf[i] == 43):
+                    i += 1
+                valid = i < n and 48 <= buf[i] <= 57
+                exponent = 0
+                while i < n and 48 <= buf[i] <= 57:
+                    exponent = exponent * 10 + (buf[i] - 48)
+                    i += 1
+                if negative_exponent:
+                    exponent = -exponent
+                value *= 10.0**exponent
+            # Surrounding spaces are allowed, anything else makes the field invalid
+            while i < n and (buf[i] == 32 or buf[i] == 13):
+                i += 1
+            if i < n and buf[i] != 9 and buf[i] != 10:
+                valid = False
+            if valid:
+                out[row, targets[col]] = -value if negative else value
+            # Skip whatever is left of a malformed field
+            while i < n and buf[i] != 9 and buf[i] != 10:
+                i += 1